@@ -1,8 +1,15 @@
 import os
+import re
 import time
+import numpy as np
+import orjson
 import requests
-from datetime import datetime, timedelta, time as dtime
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields
+from functools import lru_cache
+from datetime import timedelta, time as dtime
 from apscheduler.schedulers.background import BackgroundScheduler
+from requests.adapters import HTTPAdapter
 
 # ================= CONFIG =================
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
@@ -21,6 +28,10 @@ RR = 4
 WICK_RATIO_THRESHOLD = 0.4
 LOOKBACK_CANDLES = 6
 
+# One keep-alive pool shared by TwelveData and Telegram calls
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
 
 # ================= HELPERS =================
 def send_telegram_message(text: str):
@@ -31,13 +42,57 @@ def send_telegram_message(text: str):
     url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
     payload = {"chat_id": TELEGRAM_CHAT_ID, "text": text, "parse_mode": "HTML"}
     try:
-        r = requests.post(url, json=payload, timeout=10)
+        r = SESSION.post(url, json=payload, timeout=10)
         print("[SEND]", r.status_code)
     except Exception as e:
         print("[ERROR] Telegram:", e)
 
 
-def twelvedata_get_series(symbol, interval="15min", outputsize=100):
+class RetryPolicy:
+    """Exponential backoff for one endpoint after rate-limit or server errors"""
+
+    def __init__(self, base_delay=30, max_delay=900):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failures = 0
+        self.last_error_ts = 0.0
+        self.next_allowed_ts = 0.0
+
+    def allowed(self):
+        return time.time() >= self.next_allowed_ts
+
+    def record_success(self):
+        self.failures = 0
+        self.next_allowed_ts = 0.0
+
+    def record_failure(self):
+        self.failures += 1
+        self.last_error_ts = time.time()
+        delay = min(self.base_delay * 2 ** (self.failures - 1), self.max_delay)
+        self.next_allowed_ts = self.last_error_ts + delay
+
+
+TD_RETRY = RetryPolicy()
+
+# (symbol, interval) -> {"bucket": start of the interval bucket the fetch ran in, "values": oldest first}
+_SERIES_CACHE = {}
+
+
+@lru_cache(maxsize=16)
+def _interval_to_seconds(interval):
+    """Length of an intraday TwelveData interval in seconds, None otherwise
+
+    Day and longer candles follow exchange sessions rather than epoch-aligned
+    buckets, so they are left uncached.
+    """
+    m = re.fullmatch(r"(\d+)(min|h)", interval)
+    if not m:
+        return None
+    unit = {"min": 60, "h": 3600}[m.group(2)]
+    return int(m.group(1)) * unit
+
+
+def _twelvedata_fetch(symbol, interval, outputsize):
     base = "https://api.twelvedata.com/time_series"
     params = {
         "symbol": symbol,
@@ -46,27 +101,95 @@ def twelvedata_get_series(symbol, interval="15min", outputsize=100):
         "format": "JSON",
         "apikey": TD_API_KEY,
     }
-    r = requests.get(base, params=params, timeout=12)
-    data = r.json()
+    if not TD_RETRY.allowed():
+        raise RuntimeError("TwelveData backing off after repeated errors")
+    try:
+        r = SESSION.get(base, params=params, timeout=12)
+    except requests.RequestException:
+        TD_RETRY.record_failure()
+        raise
+    if r.status_code == 429 or r.status_code >= 500:
+        TD_RETRY.record_failure()
+        raise RuntimeError(f"TwelveData HTTP {r.status_code}")
+    data = orjson.loads(r.content)
     if "values" not in data:
+        # TwelveData also reports rate limits in the body with HTTP 200
+        if data.get("code") == 429:
+            TD_RETRY.record_failure()
         raise RuntimeError(f"TwelveData error: {data}")
-    return list(reversed(data["values"]))
+    TD_RETRY.record_success()
+    values = data["values"]
+    values.reverse()  # TwelveData returns newest first
+    return values
+
+
+def twelvedata_get_series(symbol, interval="15min", outputsize=100):
+    """Candles oldest first; cached history is reused and only the tail is refetched"""
+    step = _interval_to_seconds(interval)
+    if step is None:
+        return _twelvedata_fetch(symbol, interval, outputsize)
+
+    bucket = int(time.time()) // step * step
+    key = (symbol, interval)
+    cached = _SERIES_CACHE.get(key)
+    if cached and len(cached["values"]) < outputsize:
+        cached = None
+
+    # Only refetch the candles opened since the last call, plus the one that was
+    # still forming then (two candles within the same bucket); everything older
+    # is final and kept from the cache.
+    # On failure or backoff the cached series is served only if it was fetched in
+    # this same bucket; data from an earlier interval is reported as an error.
+    try:
+        missed = (bucket - cached["bucket"]) // step if cached else outputsize
+        if missed + 2 < outputsize:
+            fresh = _twelvedata_fetch(symbol, interval, missed + 2)
+            if not fresh:
+                raise RuntimeError("TwelveData returned no candles")
+            first = fresh[0]["datetime"]
+            values = [v for v in cached["values"] if v["datetime"] < first] + fresh
+        else:
+            values = _twelvedata_fetch(symbol, interval, outputsize)
+    except (requests.RequestException, orjson.JSONDecodeError, RuntimeError) as e:
+        if not cached or cached["bucket"] < bucket:
+            raise
+        print(f"[WARN] TwelveData {symbol}: {e}; using cached series")
+        return cached["values"][-outputsize:]
+    values = values[-outputsize:]
+
+    _SERIES_CACHE[key] = {"bucket": bucket, "values": values}
+    return list(values)
+
+
+@dataclass
+class Candles:
+    """Candle series stored as one array per field"""
+
+    datetime: np.ndarray
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+
+    def __len__(self):
+        return len(self.close)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return Candles(*(getattr(self, f.name)[key] for f in fields(self)))
+        return {f.name: getattr(self, f.name)[key].item() for f in fields(self)}
 
 
 def parse_candles(raw):
-    out = []
-    for c in raw:
-        out.append(
-            {
-                "datetime": datetime.fromisoformat(c["datetime"]),
-                "open": float(c["open"]),
-                "high": float(c["high"]),
-                "low": float(c["low"]),
-                "close": float(c["close"]),
-                "volume": float(c.get("volume") or 0),
-            }
-        )
-    return out
+    return Candles(
+        datetime=np.array([c["datetime"] for c in raw], dtype="datetime64[s]"),
+        open=np.array([c["open"] for c in raw], dtype=np.float64),
+        high=np.array([c["high"] for c in raw], dtype=np.float64),
+        low=np.array([c["low"] for c in raw], dtype=np.float64),
+        close=np.array([c["close"] for c in raw], dtype=np.float64),
+        volume=np.array([c.get("volume") or 0 for c in raw], dtype=np.float64),
+    )
 
 
 # ================= DETECTION =================
@@ -75,32 +198,45 @@ def detect_sweep_signal(candles, lookback=LOOKBACK_CANDLES):
         return {"signal": False, "reason": "not_enough_data"}
 
     window = candles[-(lookback + 1) :]
+    o, h, l, c = window.open, window.high, window.low, window.close
+
+    # Column j below describes window[j + 1]: pivot against its neighbours,
+    # wick ratio of the sweep candle, and direction of the confirm candle.
+    # On a 7-candle window this is slower than a plain loop; it is kept as masks
+    # for readability and so flat candles (high == low) give no sweep instead of
+    # dividing by zero.
+    total = h[1:-1] - l[1:-1]
+    body_top = np.maximum(o[1:-1], c[1:-1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        lower_ratio = (body_top - l[1:-1]) / total
+        upper_ratio = (h[1:-1] - body_top) / total
+
+    # LONG sweep
+    long_hit = (
+        (l[1:-1] < l[:-2]) & (l[1:-1] < l[2:])
+        & (lower_ratio > WICK_RATIO_THRESHOLD) & (c[2:] > o[2:])
+    )
+    # SHORT sweep
+    short_hit = (
+        (h[1:-1] > h[:-2]) & (h[1:-1] > h[2:])
+        & (upper_ratio > WICK_RATIO_THRESHOLD) & (c[2:] < o[2:])
+    )
 
-    for i in range(1, len(window) - 1):
-        c = window[i]
-        prev, nxt = window[i - 1], window[i + 1]
-
-        # LONG sweep
-        if c["low"] < prev["low"] and c["low"] < nxt["low"]:
-            lower_wick = (c["open"] - c["low"]) if c["open"] > c["close"] else (c["close"] - c["low"])
-            total = c["high"] - c["low"]
-            if lower_wick / total > WICK_RATIO_THRESHOLD and nxt["close"] > nxt["open"]:
-                return {"signal": True, "side": "LONG", "sweep": c, "confirm": nxt}
-
-        # SHORT sweep
-        if c["high"] > prev["high"] and c["high"] > nxt["high"]:
-            upper_wick = (c["high"] - c["close"]) if c["open"] < c["close"] else (c["high"] - c["open"])
-            total = c["high"] - c["low"]
-            if upper_wick / total > WICK_RATIO_THRESHOLD and nxt["close"] < nxt["open"]:
-                return {"signal": True, "side": "SHORT", "sweep": c, "confirm": nxt}
+    hits = long_hit | short_hit
+    if not hits.any():
+        return {"signal": False, "reason": "no_pattern"}
 
-    return {"signal": False, "reason": "no_pattern"}
+    j = int(np.argmax(hits))
+    side = "LONG" if long_hit[j] else "SHORT"
+    return {"signal": True, "side": side, "sweep": window[j + 1], "confirm": window[j + 2]}
 
 
 def compute_liquidity_zones(candles):
-    lows = [c["low"] for c in candles]
-    highs = [c["high"] for c in candles]
-    return {"low": min(lows), "high": max(highs), "last": candles[-1]["close"]}
+    return {
+        "low": float(candles.low.min()),
+        "high": float(candles.high.max()),
+        "last": float(candles.close[-1]),
+    }
 
 
 # ================= TRADE BUILDER =================
@@ -149,6 +285,12 @@ def analyze_symbol(symbol):
         return {"symbol": symbol, "error": str(e)}
 
 
+def analyze_symbols(symbols):
+    """Analyze symbols concurrently, returning results in input order"""
+    with ThreadPoolExecutor(max_workers=len(symbols)) as pool:
+        return list(pool.map(analyze_symbol, symbols))
+
+
 def format_message(analysis):
     if "error" in analysis:
         return f"⚠️ {analysis['symbol']} error: {analysis['error']}"
@@ -170,15 +312,13 @@ def format_message(analysis):
 # ================= JOBS =================
 def job_pre_alert():
     send_telegram_message("🕒 <b>Pre-NY Alert</b>\nScanning XAU & BTC...")
-    for sym in [SYMBOL_XAU, SYMBOL_BTC]:
-        res = analyze_symbol(sym)
+    for res in analyze_symbols([SYMBOL_XAU, SYMBOL_BTC]):
         send_telegram_message(format_message(res))
 
 
 def job_post_open():
     send_telegram_message("🕒 <b>NY Post-Open Alert</b>\nScanning 15m patterns...")
-    for sym in [SYMBOL_XAU, SYMBOL_BTC]:
-        res = analyze_symbol(sym)
+    for res in analyze_symbols([SYMBOL_XAU, SYMBOL_BTC]):
         send_telegram_message(format_message(res))
 
 